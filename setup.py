@@ -24,6 +24,8 @@ setup(
     author='A. Swevels, D.Fahland',
     python_requires='>=3.7',
     install_requires=['neo4j', 'numpy', 'pandas', 'tabulate', 'tqdm', 'pyyaml'],
+    # reading data sets stored as .parquet files requires a parquet engine
+    extras_require={'parquet': ['pyarrow']},
     license='GPL 3.0',
     long_description=long_description,
     long_description_content_type='text/markdown',
@@ -1,9 +1,11 @@
-from typing import Dict, Optional, List, Union
+from functools import lru_cache
 from string import Template
+from typing import Dict, Optional, List, Union, Tuple, Any
 
 from ..data_managers.datastructures import DataStructure, DatetimeObject
 from ..data_managers.semantic_header import RecordConstructor
-from ..database_managers.db_connection import Query
+from ..database_managers.db_connection import Query, PeriodicConfig
+from ..utilities.auxiliary_functions import cache_query
 
 
 def create_mapping_str(mapping: str) -> str:
@@ -15,22 +17,117 @@ def create_mapping_str(mapping: str) -> str:
     """
     if mapping == "":
         return ""
-    mapping_str = ''',{nullValues: [""], mapping:$mapping}''' if mapping != "" else ""
-    mapping_str = Template(mapping_str).safe_substitute({"mapping": mapping})
-    return mapping_str
+    return f''',{{nullValues: [""], mapping:{mapping}}}'''
 
 
 def get_match_record_types_mapping(labels):
+    # the same labels are matched by each timestamp and filter query of a structure
+    return _get_match_record_types_mapping(tuple(labels))
+
+
+@lru_cache(maxsize=256)
+def _get_match_record_types_mapping(labels: Tuple[str, ...]) -> str:
     if len(labels) == 0:
         return "MATCH (record:Record)"
-    record_types = "\n".join(
-        [f'''MATCH (record:Record) - [:IS_OF_TYPE] -> (:RecordType {{type:"{label}"}})''' for label in
-         labels])
-    return record_types
+    return "\n".join(f'''MATCH (record:Record) - [:IS_OF_TYPE] -> (:RecordType {{type:"{label}"}})'''
+                     for label in labels)
+
+
+_MATCH_RECORD_TYPE_FMT = '''MATCH ({label}_record:RecordType {{type:"{label}"}})'''
+_CREATE_RECORD_TYPE_FMT = '''CREATE (record) - [:IS_OF_TYPE] -> ({label}_record)'''
+
+
+def get_record_types_and_log_strs(labels, log_name=None) -> Tuple[str, str]:
+    """
+    Create the strings to match the record types (and log) and to relate a newly created record to them
+
+    :param labels: The labels of the record nodes
+    :param log_name: the name of the log the records belong to, if any
+    :return: tuple containing the match string and the create string
+    """
+    # the log name itself is passed as query parameter, so the strings only depend on whether there is a log
+    return _get_record_types_and_log_strs(tuple(labels), log_name is not None)
+
+
+@lru_cache(maxsize=512)
+def _get_record_types_and_log_strs(labels: Tuple[str, ...], with_log: bool) -> Tuple[str, str]:
+    match_record_types = "\n".join(_MATCH_RECORD_TYPE_FMT.format(label=label) for label in labels)
+    create_records = "\n".join(_CREATE_RECORD_TYPE_FMT.format(label=label) for label in labels)
+
+    if with_log:
+        match_record_types += '''\n MATCH (log:Log {name:$log_name})'''
+        create_records += '''\nCREATE (record)<-[:CONTAINS]-(log)'''
+
+    return match_record_types, create_records
+
+
+# the query templates are compiled once, the queries to create record nodes are constructed for every (batch of a) file
+# language=SQL
+_CREATE_NODES_BY_LOADING_CSV_TPL = Template('''
+                    CALL apoc.periodic.iterate('
+                        CALL apoc.load.csv("$file_name" $mapping_str) yield map as row return row',
+                        // the record types (and log) are matched once per batch instead of once per row
+                        '$match_record_types
+                        UNWIND $$_batch AS batch_row
+                        CREATE (record:Record)
+                        $create_records
+                        SET record += batch_row.row '
+                    , $periodic_config);
+                ''')
+
+# language=SQL
+_CREATE_NODES_BY_UNWINDING_ROWS_TPL = Template('''
+                    $match_record_types
+                    UNWIND $rows AS row
+                    CREATE (record:Record)
+                    $create_records
+                    SET record += row
+                ''')
+
+# language=SQL
+_CONVERT_TIMESTAMPS_TPL = Template('''
+                CALL apoc.periodic.iterate(
+                '$match_record_types 
+                WHERE $should_convert_conditions
+                RETURN record',
+                'SET $set_converted_attributes',
+                $periodic_config)
+            ''')
+
+# language=SQL
+_FILTER_RECORDS_BY_PROPERTY_TPL = Template('''
+                    CALL apoc.periodic.iterate(
+                    // match all records that match property
+                    '$match_record_types 
+                    WHERE record.$prop IS $negation NULL
+                    RETURN id(record) AS id',
+                    // delete record and its relationships, only the ids are passed to keep the batches small
+                    'UNWIND $$_batch AS batch_row
+                    MATCH (record) WHERE id(record) = batch_row.id
+                    DETACH DELETE record',
+                    $periodic_config)
+                    ''')
+
+# language=SQL
+_FILTER_RECORDS_BY_PROPERTY_VALUES_TPL = Template('''
+            CALL apoc.periodic.iterate(
+                // match all records that match property
+                    '$match_record_types 
+                    WHERE $negation record.$prop IN $values
+                    RETURN id(record) AS id',
+                    // delete record and its relationships, only the ids are passed to keep the batches small
+                    'UNWIND $$_batch AS batch_row
+                    MATCH (record) WHERE id(record) = batch_row.id
+                    DETACH DELETE record',
+                    // values are passed as parameter to keep the query string small
+                    $periodic_config)
+                    
+                ''')
 
 
 class DataImporterQueryLibrary:
     @staticmethod
+    @cache_query
     def get_import_directory_query() -> Query:
         """
         Query that gets the import directory of the current running database
@@ -48,16 +145,40 @@ class DataImporterQueryLibrary:
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
     def get_create_record_types_and_log_query(labels: List[str], log_name: str = None) -> Query:
-        query_str = "\n".join(
-            [f'''MERGE (:RecordType {{type:"{label}"}})''' for label in labels])
-        query_str += f'''\nMERGE (:Log {{name:"{log_name}"}})''' if log_name is not None else ""
+        """
+        Create the record types and the log (if any) the imported records are related to
 
-        return Query(query_str=query_str)
+        @param labels: The labels of the record nodes, for each label a record type is created
+        @param log_name: the name of the log to be imported
+
+        @return: Query object to create the record types and log
+        """
+
+        # the log is merged first, such that it is also created when there are no labels
+        # language=SQL
+        query_str = '''
+                    MERGE (:Log {name:$log_name})
+                    WITH true AS log_merged
+                ''' if log_name is not None else ""
+
+        # language=SQL
+        query_str += '''
+                    UNWIND $types AS type
+                    MERGE (:RecordType {type:type})
+                '''
+
+        return Query(query_str=query_str,
+                     parameters={
+                         "types": list(labels),
+                         "log_name": log_name
+                     })
 
     @staticmethod
     def get_create_nodes_by_loading_csv_query(labels: List[str], file_name: str, mapping: str,
-                                              log_name: str = None) -> Query:
+                                              log_name: str = None,
+                                              periodic_config: PeriodicConfig = PeriodicConfig(retries=1)) -> Query:
         """
         Create event nodes for each row in the batch with labels
         The properties of each row are also the property of the node
@@ -65,187 +186,162 @@ class DataImporterQueryLibrary:
         @param file_name: the name of the file to be imported
         @param labels: The labels of the record nodes
         @param log_name: the name of the log to be imported
+        @param periodic_config: the configuration of the batches used to load the file, all records are related to
+        the same record type (and log) nodes, so batches contend for the locks on these nodes when run in parallel
 
         @return: Query object to create record nodes by loading csv
         """
 
-        if log_name is not None:
-            match_log_str = '''\n MATCH (log:Log {name:$log_name})'''
-            create_log_str = '''CREATE (record)<-[:CONTAINS]-(log)'''
-        else:
-            match_log_str = ""
-            create_log_str = ""
+        match_record_types, create_records = get_record_types_and_log_strs(labels=labels, log_name=log_name)
+        if log_name is None:
             log_name = ""
 
-        match_record_types = "\n".join(
-            [f'''MATCH ({label}_record:RecordType {{type:"{label}"}})''' for label in labels])
-        match_record_types += match_log_str
-
-        create_records = "\n".join([f'''CREATE (record) - [:IS_OF_TYPE] -> ({label}_record)''' for label in labels])
-        create_records += create_log_str
-
-        # language=SQL
-        query_str = '''
-                    CALL apoc.periodic.iterate('
-                        CALL apoc.load.csv("$file_name" $mapping_str) yield map as row return row',
-                        '$match_record_types
-                        CREATE (record:Record)
-                        $create_records
-                        SET record += row '
-                    , {batchSize:$batch_size, parallel:true, retries: 1, params:{log_name: $log_name}});                    
-                '''
+        parameters = {"log_name": log_name, **periodic_config.get_parameters()}
 
-        return Query(query_str=query_str,
+        return Query(query_str=_CREATE_NODES_BY_LOADING_CSV_TPL,
                      template_string_parameters={
                          "file_name": file_name,
                          "mapping_str": create_mapping_str(mapping),
+                         "match_record_types": match_record_types,
+                         "create_records": create_records,
+                         "periodic_config": periodic_config.get_config_str(params="log_name: $log_name")
+                     },
+                     parameters=parameters)
+
+    @staticmethod
+    def get_create_nodes_by_unwinding_rows_query(labels: List[str], rows: List[Dict[str, Any]],
+                                                 log_name: str = None) -> Query:
+        """
+        Create record nodes for each row with labels, the rows are sent as parameter instead of being loaded from a
+        file in the import directory
+        The properties of each row are also the property of the node
+        @param labels: The labels of the record nodes
+        @param rows: the rows to be imported, each row is a dictionary of its properties
+        @param log_name: the name of the log to be imported
+
+        @return: Query object to create record nodes by unwinding rows
+        """
+
+        match_record_types, create_records = get_record_types_and_log_strs(labels=labels, log_name=log_name)
+
+        return Query(query_str=_CREATE_NODES_BY_UNWINDING_ROWS_TPL,
+                     template_string_parameters={
                          "match_record_types": match_record_types,
                          "create_records": create_records
                      },
                      parameters={
+                         "rows": rows,
                          "log_name": log_name
                      })
 
     @staticmethod
-    def get_make_timestamp_date_query(required_labels: List[str], attribute: str,
-                                      datetime_object: DatetimeObject) -> Query:
+    @cache_query
+    def get_convert_timestamps_query(required_labels: List[str],
+                                     datetime_conversions: List[Tuple[str, DatetimeObject]],
+                                     periodic_config: Optional[PeriodicConfig] = None) -> Query:
         """
-        Create a query to convert the strings of the timestamp to the datetime as used in Neo4j
-        Remove the str_timestamp property
+        Create a query to convert the timestamp attributes of the just imported nodes to the datetime as used in Neo4j.
+        All attributes are converted in a single pass over the records, epoch timestamps are first formatted as string
+        before they are converted.
 
         @param required_labels: the required labels of the just imported nodes
-        @param attribute: the name of the attribute that should be converted
-        @param datetime_object: the DatetimeObject describing how the attribute should be converted
+        @param datetime_conversions: list of pairs of the name of the attribute that should be converted and the
+        DatetimeObject describing how the attribute should be converted
+        @param periodic_config: the configuration of the batches, if None the conversion is run in parallel
 
-        @return: Query object to convert the timestamps string into timestamp objects
+        @return: Query object to convert the timestamps into timestamp objects
 
         """
-        offset = datetime_object.timezone_offset
-        offset = f'{attribute}+"{offset}"' if offset != "" else attribute
-
-        # language=SQL
-        query_str = '''
-                CALL apoc.periodic.iterate(
-                '$match_record_types 
-                WHERE record.$attribute IS NOT NULL AND NOT apoc.meta.cypher.isType(record.$attribute, "$date_type")
-                WITH record, record.$offset as timezone_dt
-                WITH record, datetime(apoc.date.convertFormat(timezone_dt, "$datetime_object_format", 
-                    "$datetime_object_convert_to")) as converted
-                RETURN record, converted',
-                'SET record.$attribute = converted',
-                {batchSize:$batch_size, parallel:true})
-            '''
-
-        return Query(query_str=query_str,
+        should_convert_conditions = []
+        set_converted_attributes = []
+        conversions = []
+        for index, (attribute, datetime_object) in enumerate(datetime_conversions):
+            conversion = f"$conversions[{index}]"
+            timestamp_str = f"record.{attribute}"
+            if datetime_object.is_epoch:
+                # epoch timestamps still need to be converted as long as they are numbers
+                should_convert_condition = f"toFloatOrNull(record.{attribute}) = record.{attribute}"
+                timestamp_str = f"apoc.date.format({timestamp_str}, {conversion}.unit, {conversion}.dt_format)"
+            else:
+                # timestamps still need to be converted as long as they are strings or numbers, numbers occur when the
+                # dtype mapping loaded the timestamp as number (e.g. 20230101 with format yyyyMMdd). A timestamp that
+                # is loaded as FLOAT is formatted without its decimals, as toString(20230101.0) gives "20230101.0"
+                should_convert_condition = f"toString(record.{attribute}) = record.{attribute} " \
+                                           f"OR toFloatOrNull(record.{attribute}) = record.{attribute}"
+                timestamp_str = f"""CASE WHEN toFloatOrNull(record.{attribute}) = record.{attribute}
+                                AND toInteger(record.{attribute}) = record.{attribute}
+                            THEN toString(toInteger(record.{attribute}))
+                            ELSE toString(record.{attribute})
+                        END"""
+
+            should_convert_conditions.append(f"({should_convert_condition})")
+            set_converted_attributes.append(
+                f"""record.{attribute} = CASE WHEN {should_convert_condition}
+                        THEN datetime(apoc.date.convertFormat({timestamp_str} + {conversion}.timezone_offset,
+                            {conversion}.dt_format, {conversion}.convert_to))
+                        ELSE record.{attribute}
+                    END""")
+            conversions.append({
+                "unit": datetime_object.unit,
+                "timezone_offset": datetime_object.timezone_offset,
+                "dt_format": datetime_object.format,
+                "convert_to": datetime_object.convert_to
+            })
+
+        if periodic_config is None:
+            # each batch only sets properties of its own records, so batches do not contend for locks
+            periodic_config = PeriodicConfig(parallel=True)
+
+        return Query(query_str=_CONVERT_TIMESTAMPS_TPL,
                      template_string_parameters={
                          "match_record_types": get_match_record_types_mapping(labels=required_labels),
-                         "datetime_object_format": datetime_object.format,
-                         "datetime_object_convert_to": datetime_object.convert_to,
-                         "date_type": datetime_object.get_date_type(),
-                         "attribute": attribute,
-                         "offset": offset
+                         "should_convert_conditions": "\n                    OR ".join(should_convert_conditions),
+                         "set_converted_attributes": ",\n                    ".join(set_converted_attributes),
+                         "periodic_config": periodic_config.get_config_str(params="conversions: $conversions")
+                     },
+                     parameters={
+                         "conversions": conversions,
+                         **periodic_config.get_parameters()
                      })
 
     @staticmethod
-    def get_convert_epoch_to_timestamp_query(required_labels: List[str], attribute: str,
-                                             datetime_object: DatetimeObject) -> Query:
+    def get_filter_records_by_property_query(prop: str, values: Optional[List[str]] = None,
+                                             exclude: bool = True, required_labels=["Record"],
+                                             periodic_config: PeriodicConfig = PeriodicConfig()) -> Query:
         """
-        Create a query to convert epoch timestamp to the datetime as used in Neo4j
-        Remove the str_timestamp property
+        Create a query to remove nodes and their relationships if they have (exlude) or have not (include) a certain
+        attribute or a certain attribute-value pairs.
 
-        @param required_labels: the required labels of the just imported nodes
-        @param attribute: the name of the attribute that should be converted
-        @param datetime_object: the DatetimeObject describing how the attribute should be converted
+        @param prop: the name of the property
+        @param values: a list of values that the property should (not) have for being removed
+        @param exclude: boolean indicating whether nodes should be removed if they match the criteria (exclude=True)
+        or be kept (exclude = False)
+        @param required_labels: the labels the nodes should have
+        @param periodic_config: the configuration of the batches in which the records are removed
 
-        @return: Query object to convert the epoch timestamps into timestamp objects
+        @return: Query object to remove the filtered records
 
         """
 
-        # language=SQL
-        query_str = '''
-                CALL apoc.periodic.iterate(
-                '$match_record_types 
-                WHERE record.$attribute IS NOT NULL AND NOT apoc.meta.cypher.isType(record.$attribute, $date_type)
-                WITH record, record.$attribute as timezone_dt
-                WITH record, apoc.date.format(timezone_dt, $unit, $dt_format) as converted
-                RETURN record, converted',
-                'SET record.$attribute = converted',
-                {batchSize:$batch_size, parallel:false, 
-                params: {unit: $unit,
-                        dt_format: $datetime_object_format,
-                        date_type: $date_type}})
-            '''
+        if values is None:  # match all events that have a specific property
+            negation = "NOT" if exclude else ""
+            # query to delete all records and its relationship with property
+            query_str = _FILTER_RECORDS_BY_PROPERTY_TPL
+        else:  # match all events with specific property and value
+            negation = "" if exclude else "NOT"
+            # match all r and delete them and its relationship
+            query_str = _FILTER_RECORDS_BY_PROPERTY_VALUES_TPL
 
+        # execute query
         return Query(query_str=query_str,
                      template_string_parameters={
-                         "attribute": attribute,
-                         "match_record_types": get_match_record_types_mapping(labels=required_labels)
+                         "prop": prop,
+                         "negation": negation,
+                         "match_record_types": get_match_record_types_mapping(labels=required_labels),
+                         "periodic_config": periodic_config.get_config_str(
+                             params="values:$values" if values is not None else None)
                      },
                      parameters={
-                         "unit": datetime_object.unit,
-                         "datetime_object_format": datetime_object.format,
-                         "date_type": datetime_object.convert_to.replace("ISO_", "")
+                         "values": values,
+                         **periodic_config.get_parameters()
                      })
-
-
-@staticmethod
-def get_filter_records_by_property_query(prop: str, values: Optional[List[str]] = None,
-                                         exclude: bool = True, required_labels=["Record"]) -> Query:
-    """
-    Create a query to remove nodes and their relationships if they have (exlude) or have not (include) a certain
-    attribute or a certain attribute-value pairs.
-
-    @param prop: the name of the property
-    @param values: a list of values that the property should (not) have for being removed
-    @param exclude: boolean indicating whether nodes should be removed if they match the criteria (exclude=True)
-    or be kept (exclude = False)
-    @param required_labels: the labels the nodes should have
-
-    @return: Query object to remove the load status attribute of the just imported nodes
-
-    """
-
-    if values is None:  # match all events that have a specific property
-        negation = "NOT" if exclude else ""
-        # query to delete all records and its relationship with property
-        # language=SQL
-        query_str = '''
-                    CALL apoc.periodic.iterate(
-                    // match all records that match property
-                    '$match_record_types 
-                    WHERE record.$prop IS $negation NULL
-                    RETURN record',
-                    // delete record and its relationships
-                    'DETACH DELETE record',
-                    // pass the query parameters
-                    {batchSize:$batch_size})
-                    '''
-        template_string_parameters = {"prop": prop, "negation": negation}
-    else:  # match all events with specific property and value
-        negation = "" if exclude else "NOT"
-        # match all r and delete them and its relationship
-        # language=SQL
-        query_str = '''
-            CALL apoc.periodic.iterate(
-                // match all records that match property
-                    '$match_record_types 
-                    WHERE $negation record.$prop IN $values
-                    RETURN record',
-                    // delete record and its relationships
-                    'DETACH DELETE record',
-                    // pass the query parameters
-                    {batchSize:$batch_size, params:{values:$values}})
-                    
-                '''
-        template_string_parameters = {
-            "prop": prop,
-            "negation": negation,
-            "match_record_types": get_match_record_types_mapping(labels=required_labels)
-        }
-
-    # execute query
-    return Query(query_str=query_str,
-                 template_string_parameters=template_string_parameters,
-                 parameters={
-                     "values": values
-                 })
@@ -1,31 +1,84 @@
-from ..data_managers.semantic_header import ConstructedNodes
 from ..database_managers.db_connection import Query
+from ..utilities.auxiliary_functions import cache_query, validate_name
+
+
+# the counts that are listed by get_statistics_query, every fragment is a subquery that returns a list of
+# [type, count] pairs with the most important types first
+_NODE_COUNTS = '''
+                    // List all node types and counts, each node is counted once by its first label
+                    // the count store can not be used, as it counts nodes with multiple labels under each label
+                    MATCH (n)
+                    WITH labels(n)[0] AS label, count(*) AS numberOfNodes
+                    WITH label, numberOfNodes, CASE label
+                        WHEN 'Event' THEN 0
+                        WHEN 'Entity' THEN 1
+                        WHEN 'Class' THEN 2
+                        WHEN 'Log' THEN 3
+                        ELSE 4
+                    END AS sortOrder
+                    ORDER BY sortOrder
+                    RETURN collect([label, numberOfNodes]) AS nodeCounts
+                '''
+
+_AGGREGATED_TYPE_COUNTS = '''
+                    // List all agg rel types and counts
+                    MATCH () - [r] -> ()
+                    WHERE r.type is NOT NULL
+                    WITH toUpper(r.type) as aggType
+                    WITH aggType, count(*) as aggNumberOfRelations, CASE aggType
+                      WHEN 'REL' THEN 0
+                      WHEN 'DF' THEN 1
+                      ELSE 2
+                    END as sortOrder
+                    ORDER BY sortOrder
+                    RETURN collect([aggType, aggNumberOfRelations]) AS edgeCounts
+                '''
+
+# expects the relTypesCount of apoc.meta.stats, a relationship has exactly one type, so the counts equal those of a
+# scan over all relationships, except that the count store also lists types without relationships, these are left out
+_REL_TYPE_COUNTS = '''
+                    // List all rel types and counts
+                    UNWIND keys(relTypesCount) AS type
+                    WITH type, relTypesCount[type] AS numberOfRelations
+                    WHERE numberOfRelations > 0
+                    WITH type, numberOfRelations, CASE type
+                      WHEN 'CORR' THEN 0
+                      WHEN 'OBSERVED' THEN 1
+                      WHEN 'HAS' THEN 2
+                      ELSE 3
+                    END as sortOrder
+                    ORDER BY sortOrder
+                    RETURN collect([type, numberOfRelations]) AS aggregatedEdgeCounts
+                '''
 
 
 class DBManagementQueryLibrary:
     @staticmethod
+    @cache_query
     def get_all_rel_types_query() -> Query:
-        # find all relations and return the distinct types
+        # find all relations and return the distinct types, the types are read from the database metadata
 
         # language=SQL
         query_str = '''
-                MATCH () - [rel] - () RETURN DISTINCT type(rel) AS rel_type
+                CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType AS rel_type
             '''
 
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
     def get_all_node_labels_query() -> Query:
-        # find all nodes and return the distinct labels
+        # find all nodes and return the distinct labels, the labels are read from the database metadata
 
         # language=SQL
         query_str = '''
-            MATCH (n) RETURN DISTINCT labels(n) AS label
+            CALL db.labels() YIELD label RETURN label
         '''
 
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
     def get_clear_db_query(db_name) -> Query:
         # language=SQL
         query_str = '''
@@ -33,9 +86,11 @@ class DBManagementQueryLibrary:
             WAIT
         '''
 
-        return Query(query_str=query_str, database="system", template_string_parameters={"db_name": db_name})
+        # the database name is passed as parameter, such that the query text is the same for all databases
+        return Query(query_str=query_str, database="system", parameters={"db_name": db_name})
 
     @staticmethod
+    @cache_query
     def get_delete_relationships_query() -> Query:
         # language=SQL
         query_str = '''
@@ -43,26 +98,24 @@ class DBManagementQueryLibrary:
                         "MATCH () - [r] -> () return id(r) as id", 
                         "MATCH () - [r] -> () WHERE id(r) = id DELETE r", 
                         {batchSize:$batch_size})
-                    yield batches, total 
-                    RETURN batches, total
                 '''
 
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
     def get_delete_nodes_query() -> Query:
         # language=SQL
         query_str = '''
                 CALL apoc.periodic.iterate(
                     "MATCH (n) return id(n) as id", 
                     "MATCH (n) WHERE id(n) = id DETACH DELETE n", {batchSize:$batch_size})
-                yield batches, total 
-                RETURN batches, total
             '''
 
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
     def get_replace_db_query(db_name) -> Query:
         # language=SQL
         query_str = '''
@@ -70,11 +123,13 @@ class DBManagementQueryLibrary:
                     WAIT
                 '''
 
+        # the database name is passed as parameter, such that the query text is the same for all databases
         return Query(query_str=query_str,
                      database="system",
-                     template_string_parameters={"db_name": db_name})
+                     parameters={"db_name": db_name})
 
     @staticmethod
+    @cache_query
     def get_constraints_query() -> Query:
         query_str = '''
             SHOW INDEX
@@ -83,9 +138,12 @@ class DBManagementQueryLibrary:
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
     def get_constraint_unique_entity_uid_query(node_type=None, entity_key_name="sysId") -> Query:
         if node_type is None:
             node_type = "Entity"
+        validate_name(node_type)
+        validate_name(entity_key_name)
         # language=SQL
         query_str = '''
             CREATE CONSTRAINT $constraint_name IF NOT EXISTS 
@@ -105,10 +163,11 @@ class DBManagementQueryLibrary:
 
 
     @staticmethod
+    @cache_query
     def get_set_unique_log_name_index_query() -> Query:
         # language=SQL
         query_str = '''
-            CREATE CONSTRAINT unique_entity_ids IF NOT EXISTS 
+            CREATE CONSTRAINT unique_log_names IF NOT EXISTS 
             FOR (l:Log) REQUIRE l.name IS UNIQUE
             // also set the range index
             OPTIONS {
@@ -118,7 +177,35 @@ class DBManagementQueryLibrary:
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
+    def get_entity_named_log_constraint_query() -> Query:
+        # the log name constraint used to be named unique_entity_ids, which prevented setting the constraint of the
+        # Entity nodes, drop it such that both constraints can be set
+        # language=SQL
+        query_str = '''
+            SHOW CONSTRAINTS YIELD name, labelsOrTypes
+            WHERE name = 'unique_entity_ids' AND labelsOrTypes = ['Log']
+            RETURN name
+        '''
+        return Query(query_str=query_str)
+
+    @staticmethod
+    @cache_query
+    def get_drop_constraint_query(constraint_name) -> Query:
+        validate_name(constraint_name)
+        # language=SQL
+        query_str = '''
+            DROP CONSTRAINT $constraint_name IF EXISTS
+        '''
+        return Query(query_str=query_str,
+                     template_string_parameters={
+                         "constraint_name": constraint_name
+                     })
+
+    @staticmethod
+    @cache_query
     def get_set_sysid_index_query(entity_key_name) -> Query:
+        validate_name(entity_key_name)
         # language=SQL
         query_str = '''
             CREATE RANGE INDEX entity_sys_id_index 
@@ -129,6 +216,7 @@ class DBManagementQueryLibrary:
                          "entity_key_name": entity_key_name})
 
     @staticmethod
+    @cache_query
     def get_set_activity_index_query() -> Query:
         # language=SQL
         query_str = '''
@@ -138,85 +226,88 @@ class DBManagementQueryLibrary:
         return Query(query_str=query_str)
 
     @staticmethod
-    def get_set_record_id_as_range_query() -> Query:
+    @cache_query
+    def get_set_entity_type_name_index_query() -> Query:
+        # the inference queries look up entity types by name
         # language=SQL
         query_str = '''
-                CREATE RANGE INDEX record_id_range 
-                IF NOT EXISTS FOR (r:Record) ON (r.recordId)
-        '''
+                CREATE RANGE INDEX entity_type_name_index 
+                IF NOT EXISTS FOR (et:EntityType) ON (et.name)
+            '''
         return Query(query_str=query_str)
 
     @staticmethod
-    def get_set_record_type_range_query() -> Query:
+    @cache_query
+    def get_set_event_timestamp_index_query() -> Query:
+        # the inference queries and the event log export order events by their timestamp
         # language=SQL
         query_str = '''
-                CREATE RANGE INDEX record_type_range 
-                IF NOT EXISTS FOR (rt:RecordType) ON (rt.type)
-        '''
+                CREATE RANGE INDEX event_timestamp_index 
+                IF NOT EXISTS FOR (e:Event) ON (e.timestamp)
+            '''
         return Query(query_str=query_str)
 
     @staticmethod
-    def get_node_count_query() -> Query:
+    @cache_query
+    def get_set_record_id_as_range_query() -> Query:
         # language=SQL
         query_str = '''
-                // List all node types and counts
-                MATCH (n) 
-                WITH n, CASE labels(n)[0]
-                    WHEN 'Event' THEN 0
-                    WHEN 'Entity' THEN 1
-                    WHEN 'Class' THEN 2
-                    WHEN 'Log' THEN 3
-                    ELSE 4
-                END AS sortOrder
-                WITH  labels(n)[0] AS label,  count(n) AS numberOfNodes,sortOrder
-                RETURN label,  numberOfNodes ORDER BY sortOrder
-            '''
-
+                CREATE RANGE INDEX record_id_range 
+                IF NOT EXISTS FOR (r:Record) ON (r.recordId)
+        '''
         return Query(query_str=query_str)
 
     @staticmethod
-    def get_edge_count_query() -> Query:
+    @cache_query
+    def get_drop_record_type_range_query() -> Query:
+        # the range index on the record types conflicts with their uniqueness constraint
         # language=SQL
         query_str = '''
-                // List all agg rel types and counts
-                MATCH () - [r] -> ()
-                WHERE r.type is NOT NULL
-                WITH r, CASE toUpper(r.type)
-                  WHEN 'REL' THEN 0
-                  WHEN 'DF' THEN 1
-                  ELSE 2
-                END as sortOrder
-                WITH toUpper(r.type) as aggType, count(r) as aggNumberOfRelations, sortOrder
-                RETURN aggType, aggNumberOfRelations ORDER BY sortOrder
-            '''
-
+                DROP INDEX record_type_range IF EXISTS
+        '''
         return Query(query_str=query_str)
 
     @staticmethod
-    def get_aggregated_edge_count_query() -> Query:
+    @cache_query
+    def get_constraint_unique_record_type_query() -> Query:
+        # record types are merged on their type, the uniqueness constraint also sets the range index
         # language=SQL
         query_str = '''
-                // List all rel types and counts
-                MATCH () - [r] -> ()
-                // WHERE r.type is  NULL
-                WITH r, CASE Type(r)
-                  WHEN 'CORR' THEN 0
-                  WHEN 'OBSERVED' THEN 1
-                  WHEN 'HAS' THEN 2
-                  ELSE 3
-                END as sortOrder
-                WITH Type(r) as type, count(r) as numberOfRelations, sortOrder
-                RETURN type, numberOfRelations ORDER BY sortOrder
+            CREATE CONSTRAINT unique_record_types IF NOT EXISTS 
+            FOR (rt:RecordType) REQUIRE rt.type IS UNIQUE
+            // also set the range index
+            OPTIONS {
+              indexProvider: 'range-1.0'
+            }
+        '''
+        return Query(query_str=query_str)
+
+    @staticmethod
+    @cache_query
+    def get_statistics_query() -> Query:
+        # the node counts, edge counts and aggregated edge counts in a single query, the counts are returned as lists
+        # of [type, count] pairs
+        # language=SQL
+        query_str = f'''
+                // the relationship type counts are read from the count store
+                CALL apoc.meta.stats() YIELD relTypesCount
+                CALL {{{_NODE_COUNTS}}}
+                CALL {{{_AGGREGATED_TYPE_COUNTS}}}
+                CALL {{
+                    WITH relTypesCount{_REL_TYPE_COUNTS}}}
+                RETURN nodeCounts, edgeCounts, aggregatedEdgeCounts
             '''
 
         return Query(query_str=query_str)
 
     @staticmethod
+    @cache_query
     def get_imported_logs_query() -> Query:
         # language = SQL
         query_str = '''
+            // log names are unique (see get_set_unique_log_name_index_query), so they do not have to be deduplicated
             MATCH (l:Log)
-            RETURN COLLECT(DISTINCT l.name) AS logs
+            RETURN COLLECT(l.name) AS logs
         '''
 
         return Query(query_str=query_str)
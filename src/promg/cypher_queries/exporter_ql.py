@@ -1,5 +1,6 @@
 from ..data_managers.semantic_header import ConstructedNodes
 from ..database_managers.db_connection import Query
+from ..utilities.auxiliary_functions import validate_name
 
 
 class ExporterQueryLibrary:
@@ -9,12 +10,16 @@ class ExporterQueryLibrary:
         query_str = '''
                 MATCH (e:Event) - [:CORR] -> (n:$node_label)
                 RETURN n.sysId as caseId, e.activity as activity, e.timestamp as timestamp $extra_attributes
-                ORDER BY n.ID, e.timestamp
+                ORDER BY n.sysId, e.timestamp
             '''
 
-        attributes_query = ",".join(f"e.{attribute} as {attribute}" for attribute in additional_event_attributes)
+        # attributes are substituted in the query text, so only plain property keys are accepted
+        for attribute in additional_event_attributes:
+            validate_name(attribute)
+
+        extra_attributes = "".join(f", e.{attribute} as {attribute}" for attribute in additional_event_attributes)
         return Query(query_str=query_str,
                      template_string_parameters={
                          "node_label": entity.get_label_string(),
-                         "extra_attributes": f", {attributes_query}" if len(additional_event_attributes) > 0 else ""
+                         "extra_attributes": extra_attributes
                      })
@@ -1,17 +1,23 @@
+from string import Template
 from ..data_managers.semantic_header import ConstructedNodes
 from ..database_managers.db_connection import Query
 
 
-class InferenceEngineQueryLibrary:
-    @staticmethod
-    def get_query_infer_items_propagate_upwards_multiple_levels(entity: ConstructedNodes, is_load=True) -> Query:
-        # language=sql
-        query_str = '''
-                MATCH (f2:Event) - [:CORR] -> (n:$entity)
+# the query templates are compiled once when the module is imported
+
+# the propagation queries merge a relation for every matched event, the events are processed in batches such that a
+# single transaction does not claim too much memory, batches are not run in parallel as they merge relations to the
+# same nodes. Note that the batches see the relations merged by earlier batches, the downward propagation reads the
+# CORR relations of the preceding event, which can be merged in an earlier batch of the same query. Hence, the result
+# can depend on the order of the batches (the order in which the events are matched) and on the batch size.
+# language=sql
+_INFER_ITEMS_PROPAGATE_UPWARDS_MULTIPLE_LEVELS_TPL = Template('''
+                CALL apoc.periodic.iterate(
+                "MATCH (f2:Event) - [:CORR] -> (n:$entity)
                 MATCH (f2) - [:CORR] ->  (equipment:Equipment)
                 MATCH (f2) - [:OBSERVED] -> (a2:Activity) - [:AT] -> (l:Location) - [:PART_OF*0..] -> (k:Location) 
-                WITH f2, k, equipment, n
-                CALL {WITH f2, k, equipment
+                RETURN f2, k, equipment, n",
+                "CALL {WITH f2, k, equipment
                     MATCH (f0:Event) - [:OBSERVED] -> (a0: Activity)
                     MATCH (a0) - [:$operation_type] -> (et:EntityType {name: '$entity'})  
                     MATCH (a0) - [:AT] -> (k)
@@ -20,30 +26,20 @@ class InferenceEngineQueryLibrary:
                     RETURN f0 as f0_first
                     ORDER BY f0.timestamp $order_type
                     LIMIT 1}
-                MERGE (f0_first) - [:CORR] -> (n)
-                '''
-
-        return Query(query_str=query_str,
-                     template_string_parameters={
-                         "entity": entity.type,
-                         "operation_type": "LOADS" if is_load else "UNLOADS",
-                         "comparison": "<=" if is_load else ">=",
-                         "order_type": "DESC" if is_load else ""
-                     })
+                MERGE (f0_first) - [:CORR] -> (n)",
+                {batchSize: $$batch_size, parallel: false})
+                ''')
 
-    @staticmethod
-    def get_query_infer_items_propagate_downwards_multiple_level_w_batching(entity: ConstructedNodes,
-                                                                            relative_position: ConstructedNodes) -> \
-            Query:
-        # language=sql
-        query_str = '''
-                MATCH (f2:Event) - [:CORR] -> (bp:$relative_position)
+# language=sql
+_INFER_ITEMS_PROPAGATE_DOWNWARDS_MULTIPLE_LEVEL_W_BATCHING_TPL = Template('''
+                CALL apoc.periodic.iterate(
+                "MATCH (f2:Event) - [:CORR] -> (bp:$relative_position)
                 MATCH (f2) - [:CORR] -> (equipment :Equipment)
                 MATCH (f2) - [:OBSERVED] -> (a2:Activity) -[:AT]-> (l:Location) - [:PART_OF*0..] -> (k:Location) 
                 // ensure f2 should have operated on the required by checking that the activity operates on that entity
                 MATCH (a2) - -> (:EntityType {name: '$entity'}) 
-                WITH f2, equipment, k, bp
-                CALL {WITH f2, equipment, k
+                RETURN f2, equipment, k, bp",
+                "CALL {WITH f2, equipment, k
                     MATCH (f0: Event)-[:OBSERVED]->(a0:Activity) - [:LOADS] ->  (:EntityType {name: '$entity'})
                     MATCH (a0) - [:AT] -> (k)
                     MATCH (f0)-[:CORR]->(resource)
@@ -55,29 +51,21 @@ class InferenceEngineQueryLibrary:
                 }
                 // only merge when f0_first_prec is actually related to the required entity
                 WITH f2, [(f0_first_prec)-[:CORR]->(n:$entity)- [:AT_POS] -> (bp) | n] as related_n
-                FOREACH (n in related_n | 
-                    MERGE (f2) - [:CORR] -> (n)
-                )
-            '''
+                UNWIND related_n AS n
+                MERGE (f2) - [:CORR] -> (n)",
+                {batchSize: $$batch_size, parallel: false})
+            ''')
 
-        return Query(query_str=query_str,
-                     template_string_parameters={
-                         "entity": entity.type,
-                         "relative_position": relative_position.type
-                     })
-
-    @staticmethod
-    def get_query_infer_items_propagate_downwards_one_level(entity: ConstructedNodes) -> Query:
-        # language=sql
-        query_str = '''
-                        MATCH (f1 :Event) - [:CORR] -> (equipment :Equipment)
+# language=sql
+_INFER_ITEMS_PROPAGATE_DOWNWARDS_ONE_LEVEL_TPL = Template('''
+                        CALL apoc.periodic.iterate(
+                        "MATCH (f1 :Event) - [:CORR] -> (equipment :Equipment)
                         MATCH (f1) - [:OBSERVED] -> (a1:Activity) -[:AT]-> (l:Location)
-                        // ensure f2 should have operated on the required by checking that the activity operates on 
-                        that  
-                        entity
+                        // ensure f1 should have operated on the required by checking that the activity operates on
+                        // that entity
                         MATCH (a1) - -> (:EntityType {name: '$entity'}) 
-                        WITH f1, equipment, l
-                        CALL {WITH f1, equipment, l
+                        RETURN f1, equipment, l",
+                        "CALL {WITH f1, equipment, l
                             MATCH (f0: Event)-[:OBSERVED]->(a0:Activity) - [:LOADS] -> (:EntityType {name: '$entity'})
                             MATCH (a0) - [:AT] -> (l)
                             MATCH (f0)-[:CORR]->(equipment)
@@ -87,12 +75,51 @@ class InferenceEngineQueryLibrary:
                             ORDER BY f0.timestamp DESC
                             LIMIT 1
                         }
-                        // only merge when f0_first_prec is actually related to a Box
+                        // only merge when f0_first_prec is actually related to the required entity
                         WITH f1, [(f0_first_prec)-[:CORR]->(n:$entity) | n] as related_n
-                        FOREACH (n in related_n | 
-                            MERGE (f1) - [:CORR] -> (n)
-                        )
-                        '''
+                        UNWIND related_n AS n
+                        MERGE (f1) - [:CORR] -> (n)",
+                        {batchSize: $$batch_size, parallel: false})
+                        ''')
+
+# language=sql
+_MATCH_ENTITY_WITH_BATCH_POSITION_TPL = Template('''
+                    MATCH (e:Event) - [:CORR] -> (b:$entity)
+                    MATCH (e) - [:CORR] -> (bp:$relative_position)
+                    // each pair is matched once, such that MERGE does not check the same pair for every event
+                    WITH DISTINCT b, bp
+                    MERGE (b) - [:AT_POS] -> (bp)
+                ''')
+
+
+class InferenceEngineQueryLibrary:
+    @staticmethod
+    def get_query_infer_items_propagate_upwards_multiple_levels(entity: ConstructedNodes, is_load=True) -> Query:
+        query_str = _INFER_ITEMS_PROPAGATE_UPWARDS_MULTIPLE_LEVELS_TPL
+
+        return Query(query_str=query_str,
+                     template_string_parameters={
+                         "entity": entity.type,
+                         "operation_type": "LOADS" if is_load else "UNLOADS",
+                         "comparison": "<=" if is_load else ">=",
+                         "order_type": "DESC" if is_load else ""
+                     })
+
+    @staticmethod
+    def get_query_infer_items_propagate_downwards_multiple_level_w_batching(entity: ConstructedNodes,
+                                                                            relative_position: ConstructedNodes) -> \
+            Query:
+        query_str = _INFER_ITEMS_PROPAGATE_DOWNWARDS_MULTIPLE_LEVEL_W_BATCHING_TPL
+
+        return Query(query_str=query_str,
+                     template_string_parameters={
+                         "entity": entity.type,
+                         "relative_position": relative_position.type
+                     })
+
+    @staticmethod
+    def get_query_infer_items_propagate_downwards_one_level(entity: ConstructedNodes) -> Query:
+        query_str = _INFER_ITEMS_PROPAGATE_DOWNWARDS_ONE_LEVEL_TPL
 
         return Query(query_str=query_str,
                      template_string_parameters={
@@ -101,12 +128,7 @@ class InferenceEngineQueryLibrary:
 
     @staticmethod
     def get_match_entity_with_batch_position_query(entity: ConstructedNodes, relative_position: ConstructedNodes) -> Query:
-        # language=sql
-        query_str = '''
-                    MATCH (e:Event) - [:CORR] -> (b:Box)
-                    MATCH (e) - [:CORR] -> (bp:$relative_position)
-                    MERGE (b:Box) - [:AT_POS] -> (bp:$relative_position)
-                '''
+        query_str = _MATCH_ENTITY_WITH_BATCH_POSITION_TPL
 
         return Query(query_str=query_str,
                      template_string_parameters={
@@ -1,8 +1,56 @@
+from string import Template
 from typing import Optional, List
 from ..data_managers.semantic_header import ConstructedNodes
 from ..database_managers.db_connection import Query
 
 
+# the query templates are compiled once when the module is imported, the entity type and thresholds are passed as
+# parameters such that the same query plan is used for all entity types with the same labels
+# language=sql
+_AGGREGATE_DF_RELATIONS_TPL = Template('''
+                                MATCH 
+                                (c1:Activity) -[:OBSERVED]-> (e1:Event) 
+                                    -[df:$df_label {entityType: $$entity_type}]-> 
+                                (e2:Event) <-  [:OBSERVED] - (c2:Activity)
+                                $classifier_filter
+                                WITH c1, count(df) AS df_freq,c2
+                                MERGE 
+                                (c1) 
+                                    -[rel2:$dfc_label {entityType: $$entity_type, type:'DF_A'}]-> 
+                                (c2) 
+                                ON CREATE SET rel2.count=df_freq''')
+
+# language=sql
+_AGGREGATE_DF_RELATIONS_WITH_THRESHOLD_TPL = Template('''
+                                MATCH 
+                                (c1:Activity) 
+                                    -[:OBSERVED]->
+                                (e1:Event) 
+                                    -[df:$df_label {entityType: $$entity_type}]-> 
+                                (e2:Event) <-[:OBSERVED]- (c2:Activity)
+                                $classifier_filter
+                                // a directly follows relation is counted once for every entity both events are 
+                                // correlated to
+                                WITH c1, c2, count(df) AS df_count, 
+                                    sum(size([(e1) -[:CORR]-> (n) <-[:CORR]- (e2) | n])) AS df_freq
+                                // look up the frequency in the reverse direction in a map of all pairs, instead of 
+                                // matching the reverse directly follows relations again for every pair, the reverse 
+                                // frequency counts every directly follows relation once
+                                WITH collect({c1: c1, c2: c2, df_count: df_count, df_freq: df_freq}) AS pairs
+                                WITH pairs, apoc.map.fromPairs(
+                                    [pair IN pairs | [toString(id(pair.c1)) + ',' + toString(id(pair.c2)), 
+                                                      pair.df_count]]) AS df_freqs
+                                UNWIND pairs AS pair
+                                WITH pair.c1 AS c1, pair.df_freq AS df_freq, pair.c2 AS c2,
+                                    coalesce(df_freqs[toString(id(pair.c2)) + ',' + toString(id(pair.c1))], 0) 
+                                        AS df_freq2
+                                WHERE df_freq > $$df_threshold AND (df_freq*$$relative_df_threshold > df_freq2)
+                                MERGE 
+                                (c1) 
+                                    -[rel2:$dfc_label {entityType: $$entity_type, type:'DF_A'}]-> 
+                                (c2) 
+                                ON CREATE SET rel2.count=df_freq''')
+
 class AnalysisQueryLibrary:
 
     @staticmethod
@@ -10,59 +58,38 @@ class AnalysisQueryLibrary:
                                          include_label_in_df_a: bool = True,
                                          df_threshold: int = 0,
                                          relative_df_threshold: float = 0,
-                                         exclude_self_loops=True) -> Query:
+                                         exclude_self_loops=True,
+                                         activity_names: Optional[List[str]] = None) -> Query:
 
         # add relations between classes when desired
         if df_threshold == 0 and relative_df_threshold == 0:
             # corresponds to aggregate_df_relations &  aggregate_df_relations_for_entities in graphdb-event-logs
             # aggregate only for a specific entity type and event classifier
 
-            # language=sql
-            query_str = '''
-                                MATCH 
-                                (c1:Activity) -[:OBSERVED]-> (e1:Event) 
-                                    -[df:$df_label {entityType: '$entity_type'}]-> 
-                                (e2:Event) <-  [:OBSERVED] - (c2:Activity)
-                                $classifier_self_loops
-                                WITH c1, count(df) AS df_freq,c2
-                                MERGE 
-                                (c1) 
-                                    -[rel2:$dfc_label {entityType: '$entity_type', type:'DF_A'}]-> 
-                                (c2) 
-                                ON CREATE SET rel2.count=df_freq'''
+            query_str = _AGGREGATE_DF_RELATIONS_TPL
         else:
             # aggregate only for a specific entity type and event classifier
             # include only edges with a minimum threshold, drop weak edges (similar to heuristics miner)
 
-            # language=sql
-            query_str = '''
-                                MATCH 
-                                (c1:Activity) 
-                                    -[:OBSERVED]->
-                                (e1:Event) 
-                                    -[df:$df_label {entityType: '$entity_type'}]-> 
-                                (e2:Event) <-[:OBSERVED]- (c2:Activity)
-                                MATCH (e1) -[:CORR] -> (n) <-[:CORR]- (e2)
-                                $classifier_self_loops
-                                WITH c1,count(df) AS df_freq,c2
-                                WHERE df_freq > $df_threshold
-                                OPTIONAL MATCH (c2:Activity) -[:OBSERVED]-> (e2b:Event) -[df2:$df_label {entityType: 
-                                '$entity_type'}]-> 
-                                    (e1b:Event) <-[:OBSERVED]- (c2:Activity)
-                                WITH c1,df_freq,count(df2) AS df_freq2,c2
-                                WHERE (df_freq*$relative_df_threshold > df_freq2)
-                                MERGE 
-                                (c1) 
-                                    -[rel2:$dfc_label {entityType: '$entity_type', type:'DF_A'}]-> 
-                                (c2) 
-                                ON CREATE SET rel2.count=df_freq'''
+            query_str = _AGGREGATE_DF_RELATIONS_WITH_THRESHOLD_TPL
+
+        classifier_conditions = []
+        if exclude_self_loops:
+            classifier_conditions.append("c1 <> c2")
+        if activity_names is not None:
+            # restrict the aggregation to the given activities, such that the activities are found using the index
+            classifier_conditions.append("c1.activity IN $activity_names AND c2.activity IN $activity_names")
+        classifier_filter = "WHERE " + " AND ".join(classifier_conditions) if classifier_conditions else ""
 
         return Query(query_str=query_str,
                      template_string_parameters={
                          "df_label": entity.get_df_label(),
+                         "classifier_filter": classifier_filter,
+                         "dfc_label": entity.get_df_a_label(include_label_in_df_a)
+                     },
+                     parameters={
                          "entity_type": entity.type,
-                         "classifier_self_loops": "WHERE c1 <> c2" if exclude_self_loops else "",
-                         "dfc_label": entity.get_df_a_label(include_label_in_df_a),
                          "df_threshold": df_threshold,
-                         "relative_df_threshold": relative_df_threshold
+                         "relative_df_threshold": relative_df_threshold,
+                         "activity_names": list(activity_names) if activity_names is not None else None
                      })
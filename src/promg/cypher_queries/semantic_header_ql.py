@@ -4,12 +4,122 @@ from typing import Union, Optional, List
 from ..data_managers.semantic_header import ConstructedNodes, NodeConstructor, Node, \
     RelationConstructor, RecordConstructor, ConstructedRelation
 from ..database_managers.db_connection import Query
+from ..utilities.auxiliary_functions import cache_query
+
+
+# the query templates are compiled once when the module is imported
+# language=SQL
+_INFER_REL_TPL = Template('''
+                    CALL {WITH record, $result_node_name
+                            $record_match
+                            MATCH ($event_node) - [:EXTRACTED_FROM] -> (record) <- [:EXTRACTED_FROM] - (
+                                $result_node_name)
+                                MERGE (event) - [:$relation_type] -> ($result_node_name)}''')
+
+# language=SQL
+_INFER_CORR_FROM_RECORD = '''
+            WITH record, $result_node_name
+                                MATCH (event:$event_label) - [:EXTRACTED_FROM] -> (record) <- [:EXTRACTED_FROM] - (
+                                $result_node_name)
+                                MERGE (event) - [:$corr_type] -> ($result_node_name)'''
+
+# language=SQL
+_CREATE_NODE_BY_RECORD_CONSTRUCTOR_TPL = Template('''
+                    CALL apoc.periodic.iterate(
+                    'MATCH ($record) $log_check_str
+                    $record_matches
+                    // order records by elementId, this will determine the order in which events are created
+                    // this is important for the temporal ordering of :Event nodes 
+                    // when creating DF edges in case the timestamps are similar
+                          RETURN record ORDER BY elementId(record)',
+                          '$merge_or_create_node
+                          $set_label_str
+                          $set_property_str
+                          $infer_corr_str
+                          $infer_observed_str', {batchSize:$batch_size, params:{logs:$logs}})
+                    ''')
+
+# language=SQL
+_CREATE_RELATION_BY_RELATIONS_TPL = Template('''
+                CALL apoc.periodic.iterate(
+                '$relation_queries                        
+                RETURN distinct $from_node_name, $to_node_name',
+                '$merge_str
+                $set_properties_str',                        
+                {batchSize: $batch_size})
+            ''')
+
+# language=SQL
+_CREATE_RELATION_USING_RECORD_TPL = Template('''     CALL apoc.periodic.iterate('
+                            MATCH ($record) $log_check_str
+                            $record_matches
+                            RETURN record',
+                            '
+                            MATCH ($from_node) - [:EXTRACTED_FROM] -> (record)
+                            MATCH ($to_node) - [:EXTRACTED_FROM] -> (record)
+                            $merge_str
+                            $set_properties_str',
+                            {batchSize:$batch_size, params:{logs:$logs}})
+                        ''')
+
+# language=SQL
+_CREATE_DIRECTLY_FOLLOWS_TPL = Template('''
+                             CALL apoc.periodic.iterate(
+                                'MATCH (n:$entity_labels_string) <-[:$corr_type_string]- (e:$event_label)
+                                $min_id_subquery
+                                WITH n , e as nodes ORDER BY e.timestamp, $order_key
+                                WITH n , collect (nodes) as nodeList
+                                UNWIND range(0,size(nodeList)-2) AS i
+                                WITH n , nodeList[i] as first, nodeList[i+1] as second
+                                RETURN $return_variables $add_duration_str',
+                                'MERGE (first) -[df:$df_entity {entityType: $entity_type}]->(second)
+                                 SET df.type = "DF"
+                                 $set_entity_id
+                                 SET df.duration = duration
+                                ',
+                                {batchSize: $batch_size, params: {entity_type: $entity_type}})
+                            ''')
+
+# language=SQL
+_ASSOCIATED_RECORD_TYPES_TPL = Template('''
+            MATCH (record:Record) - [:IS_OF_TYPE] -> (record_type:RecordType)
+            MATCH (record) <- [:CONTAINS] - (log:Log)
+            WHERE log.name in $logs
+            RETURN collect(distinct record_type.type) as labels
+        ''')
+
+# language=SQL
+_INFER_CORR_FROM_PARENT_TPL = Template('''
+            CALL apoc.periodic.iterate('
+                MATCH (e:Event) --> ($node) - [:$from_or_to] - (relation:$relation_label_str)
+                WHERE NOT EXISTS ((e) - [:CORR] -> (relation))
+                RETURN DISTINCT relation, e',
+                'MERGE (e) - [:$corr_type] -> (relation)',
+                {batchSize:$batch_size}
+                )       
+            ''')
+
+# language=SQL
+_MERGE_DUPLICATE_DF_ENTITY_TPL = Template('''
+                        MATCH (n1:Event)-[rel:$df_entity {entityType: $entity_type}]->(n2:Event)
+                        WITH n1, n2, collect(rel) AS rels
+                        WHERE size(rels) > 1
+                        // only include this and the next line if you want to remove the existing relationships
+                        UNWIND rels AS rel 
+                        DELETE rel
+                        MERGE (n1)
+                            -[:$df_entity {entityType: $entity_type, count:size(rels), type: 'DF'}]->
+                              (n2)
+                    ''')
 
 
 class SemanticHeaderQueryLibrary:
     @staticmethod
     def get_create_node_by_record_constructor_query(node_constructor: NodeConstructor, merge=True,
                                                     logs: Optional[List[str]] = None) -> Query:
+        # the accessors of the constructor are called once, their results are used in several parts of the query
+        result_node_name = node_constructor.result.get_name()
+
         if merge:
             # for each result node, merge the node if it does not exist yet. Then merge it to the record node.
             # So, even though a Entity may appear in multiple records, it is only created once.
@@ -35,35 +145,17 @@ class SemanticHeaderQueryLibrary:
         # in case multiple correlations can be inferred depending on the record types, we create a string for each
         # inference
         if len(node_constructor.inferred_relationships) > 0:
-            infer_corr_str = '''WITH record, $result_node_name'''
-            for relationship in node_constructor.inferred_relationships:
-                infer_rel_str = '''
-                    CALL {WITH record, $result_node_name
-                            $record_match
-                            MATCH ($event_node) - [:EXTRACTED_FROM] -> (record) <- [:EXTRACTED_FROM] - (
-                                $result_node_name)
-                                MERGE (event) - [:$relation_type] -> ($result_node_name)}'''
-                infer_rel_str = Template(infer_rel_str).safe_substitute({
+            infer_corr_str = '''WITH record, $result_node_name''' + "".join(
+                _INFER_REL_TPL.safe_substitute({
+                    "result_node_name": result_node_name,
                     "event_node": relationship.event.get_pattern(name="event"),
                     "record_match": relationship.get_record_type_match(record_name="record"),
                     "relation_type": relationship.relation_type
-                })
-                infer_corr_str += infer_rel_str
-        elif node_constructor.infer_corr_from_event_record:
+                }) for relationship in node_constructor.inferred_relationships)
+        elif node_constructor.infer_corr_from_event_record or node_constructor.infer_corr_from_entity_record:
             # only one correlation is created, create a string for this with the corr type
-            # language=SQL
-            infer_corr_str = '''
-            WITH record, $result_node_name
-                                MATCH (event:$event_label) - [:EXTRACTED_FROM] -> (record) <- [:EXTRACTED_FROM] - (
-                                $result_node_name)
-                                MERGE (event) - [:$corr_type] -> ($result_node_name)'''
-        elif node_constructor.infer_corr_from_entity_record:  # TODO update such that only correct events are considered
-            # language=SQL
-            infer_corr_str = '''
-                        WITH record, $result_node_name
-                                MATCH (event:$event_label) - [:EXTRACTED_FROM] -> (record) <- [:EXTRACTED_FROM] - (
-                                $result_node_name)
-                                MERGE (event) - [:$corr_type] -> ($result_node_name)'''
+            # TODO update such that only correct events are considered when inferring from an entity record
+            infer_corr_str = _INFER_CORR_FROM_RECORD
 
         # in case an observed relations needs to be created, we define the string
         infer_observed_str = ""
@@ -76,32 +168,16 @@ class SemanticHeaderQueryLibrary:
                                 MERGE (event) <- [:OBSERVED] - ($result_node_name)
                                 '''
 
-        # add check to only transform records from the imported logs
+        # add check to only transform records from the imported logs, the log names are passed as parameter such that
+        # the same query plan is used for all logs
         if logs is not None:
-            log_str = ",".join([f'"{log}"' for log in logs])
-            log_check_str = f"<- [:CONTAINS] - (log:Log) WHERE log.name in [{log_str}]"
+            log_check_str = "<- [:CONTAINS] - (log:Log) WHERE log.name in $logs"
         else:
             log_check_str = ""
 
         # create the overall query where we match the correct record nodes
         # then we create/merge the resulting node and set all labels, properties and inferred relations
-        # language=SQL
-        query_str = '''
-                    CALL apoc.periodic.iterate(
-                    'MATCH ($record) $log_check_str
-                    $record_matches
-                    // order records by elementId, this will determine the order in which events are created
-                    // this is important for the temporal ordering of :Event nodes 
-                    // when creating DF edges in case the timestamps are similar
-                          RETURN record ORDER BY elementId(record)',
-                          '$merge_or_create_node
-                          $set_label_str
-                          $set_property_str
-                          $infer_corr_str
-                          $infer_observed_str', {batchSize:$batch_size})
-                    '''
-
-        query_str = Template(query_str).safe_substitute({
+        query_str = _CREATE_NODE_BY_RECORD_CONSTRUCTOR_TPL.safe_substitute({
             "set_label_str": set_label_str,
             "set_property_str": set_property_str,
             "infer_corr_str": infer_corr_str,
@@ -116,29 +192,20 @@ class SemanticHeaderQueryLibrary:
                          "record_matches": node_constructor.get_prevalent_match_record_pattern(node_name="record"),
                          "record_name": "record",
                          "result_node": node_constructor.result.get_pattern(),
-                         "result_node_name": node_constructor.result.get_name(),
-                         "set_result_properties": node_constructor.get_set_result_properties_query(),
+                         "result_node_name": result_node_name,
+                         "set_result_properties": set_property_str,
                          "set_labels": node_constructor.get_set_result_labels_query(),
                          "corr_type": node_constructor.corr_type,
                          "event_label": node_constructor.event_label
-                     })
+                     },
+                     parameters={"logs": list(logs) if logs is not None else None})
 
     @staticmethod
+    @cache_query
     def get_associated_record_types_query(logs):
-        log_str = ",".join([f'"{log}"' for log in logs])
-        log_str = f"[{log_str}]"
-
         # request all associated record types for specific logs
-        query_str = '''
-            MATCH (record:Record) - [:IS_OF_TYPE] -> (record_type:RecordType)
-            MATCH (record) <- [:CONTAINS] - (log:Log)
-            WHERE log.name in $log_str
-            RETURN collect(distinct record_type.type) as labels
-        '''
-
-        return Query(query_str=query_str,
-                     template_string_parameters={"log_str": log_str})
-
+        return Query(query_str=_ASSOCIATED_RECORD_TYPES_TPL,
+                     parameters={"logs": list(logs)})
 
     @staticmethod
     def get_infer_corr_from_parent_query(relation_constructor, use_from):
@@ -150,17 +217,7 @@ class SemanticHeaderQueryLibrary:
             from_or_to = "TO"
 
         # add correlation to a child node if its parent is correlated to an event
-        query_str = '''
-            CALL apoc.periodic.iterate('
-                MATCH (e:Event) --> ($node) - [:$from_or_to] - (relation:$relation_label_str)
-                WHERE NOT EXISTS ((e) - [:CORR] -> (relation))
-                RETURN DISTINCT relation, e',
-                'MERGE (e) - [:$corr_type] -> (relation)',
-                {batchSize:$batch_size}
-                )       
-            '''
-
-        return Query(query_str=query_str,
+        return Query(query_str=_INFER_CORR_FROM_PARENT_TPL,
                      template_string_parameters={
                          "node": node,
                          "from_or_to": from_or_to,
@@ -179,17 +236,7 @@ class SemanticHeaderQueryLibrary:
         else:
             merge_str = "MERGE ($from_node_name) -[$rel_pattern] -> ($to_node_name)"
 
-        # language=SQL
-        query_str = '''
-                CALL apoc.periodic.iterate(
-                '$relation_queries                        
-                RETURN distinct $from_node_name, $to_node_name',
-                '$merge_str
-                $set_properties_str',                        
-                {batchSize: $batch_size})
-            '''
-
-        query_str = Template(query_str).safe_substitute({
+        query_str = _CREATE_RELATION_BY_RELATIONS_TPL.safe_substitute({
             "merge_str": merge_str
         })
 
@@ -217,10 +264,10 @@ class SemanticHeaderQueryLibrary:
         else:
             merge_str = "MERGE ($from_node_name) -[$rel_pattern] -> ($to_node_name)"
 
-        # add check to only transform records from the imported logs
+        # add check to only transform records from the imported logs, the log names are passed as parameter such that
+        # the same query plan is used for all logs
         if logs is not None:
-            log_str = ",".join([f'"{log}"' for log in logs])
-            log_check_str = f"<- [:CONTAINS] - (log:Log) WHERE log.name in [{log_str}]"
+            log_check_str = "<- [:CONTAINS] - (log:Log) WHERE log.name in $logs"
         else:
             log_check_str = ""
 
@@ -228,19 +275,7 @@ class SemanticHeaderQueryLibrary:
         # then match all from and to nodes that are extracted from these records
         # merge the resulting node
         # set the optional properties
-        query_str = '''     CALL apoc.periodic.iterate('
-                            MATCH ($record) $log_check_str
-                            $record_matches
-                            RETURN record',
-                            '
-                            MATCH ($from_node) - [:EXTRACTED_FROM] -> (record)
-                            MATCH ($to_node) - [:EXTRACTED_FROM] -> (record)
-                            $merge_str
-                            $set_properties_str',
-                            {batchSize:$batch_size})
-                        '''
-
-        query_str = Template(query_str).safe_substitute({
+        query_str = _CREATE_RELATION_USING_RECORD_TPL.safe_substitute({
             "merge_str": merge_str,
             "log_check_str": log_check_str
         })
@@ -256,7 +291,8 @@ class SemanticHeaderQueryLibrary:
                          "rel_pattern": relation_constructor.result.get_pattern("relation"),
                          "relation_labels": relation_constructor.result.get_relation_types_str(as_list=True),
                          "set_properties_str": relation_constructor.get_set_result_properties_query("relation")
-                     })
+                     },
+                     parameters={"logs": list(logs) if logs is not None else None})
 
     @staticmethod
     def get_add_duration_query_str(add_duration) -> str:
@@ -293,96 +329,41 @@ class SemanticHeaderQueryLibrary:
         # unwind the list from 0 to the one-to-last node
         # find neighbouring nodes and add an edge between
 
-        # language=sql
-
         if event_label == "CompoundEvent":
-            if entity.type == "Resource":
-                query_str = '''
-                     CALL apoc.periodic.iterate(
-                        'MATCH (n:$entity_labels_string) <-[:$corr_type_string]- (e:$event_label)
+            # compound events with the same timestamp are ordered by the first event they consist of
+            min_id_subquery = '''
                         CALL {
                                 WITH e
                                 MATCH (e) - [:CONSISTS_OF] -> (single_event:Event)
                                 RETURN id(single_event) as min_id ORDER BY id(single_event)
                                 LIMIT 1
-                            }
-                        WITH n , e as nodes ORDER BY e.timestamp, min_id
-                        WITH n , collect (nodes) as nodeList
-                        UNWIND range(0,size(nodeList)-2) AS i
-                        WITH n , nodeList[i] as first, nodeList[i+1] as second
-                        RETURN n, first, second $add_duration_str',
-                        'MERGE (first) -[df:$df_entity {entityType: "$entity_type"}]->(second)
-                         SET df.type = "DF"
-                         SET df.entityId = n.sysId
-                         SET df.duration = duration
-                        ',
-                        {batchSize: $batch_size})
-                    '''
-            else:
-                query_str = '''
-                                     CALL apoc.periodic.iterate(
-                                        'MATCH (n:$entity_labels_string) <-[:$corr_type_string]- (e:$event_label)
-                                        CALL {
-                                                WITH e
-                                                MATCH (e) - [:CONSISTS_OF] -> (single_event:Event)
-                                                RETURN id(single_event) as min_id ORDER BY id(single_event)
-                                                LIMIT 1
-                                            }
-                                        WITH n , e as nodes ORDER BY e.timestamp, min_id
-                                        WITH n , collect (nodes) as nodeList
-                                        UNWIND range(0,size(nodeList)-2) AS i
-                                        WITH n , nodeList[i] as first, nodeList[i+1] as second
-                                        RETURN first, second $add_duration_str',
-                                        'MERGE (first) -[df:$df_entity {entityType: "$entity_type"}]->(second)
-                                         SET df.type = "DF"
-                                         SET df.duration = duration
-                                        ',
-                                        {batchSize: $batch_size})
-                                    '''
-
+                            }'''
+            order_key = "min_id"
         else:
-            query_str = '''
-                             CALL apoc.periodic.iterate(
-                                'MATCH (n:$entity_labels_string) <-[:$corr_type_string]- (e:$event_label)
-                                WITH n , e as nodes ORDER BY e.timestamp, ID(e)
-                                WITH n , collect (nodes) as nodeList
-                                UNWIND range(0,size(nodeList)-2) AS i
-                                WITH n , nodeList[i] as first, nodeList[i+1] as second
-                                RETURN first, second $add_duration_str',
-                                'MERGE (first) -[df:$df_entity {entityType: "$entity_type"}]->(second)
-                                 SET df.type = "DF"
-                                 SET df.duration = duration
-                                ',
-                                {batchSize: $batch_size})
-                            '''
+            min_id_subquery = ""
+            order_key = "ID(e)"
 
-        return Query(query_str=query_str,
+        # the DF edges between compound events of a resource store the resource they belong to
+        store_entity_id = event_label == "CompoundEvent" and entity.type == "Resource"
+
+        return Query(query_str=_CREATE_DIRECTLY_FOLLOWS_TPL,
                      template_string_parameters={
                          "entity_labels_string": entity.get_label_string(),
                          "corr_type_string": entity.get_corr_type_strings(),
                          "event_label": event_label,
                          "df_entity": entity.get_df_label(),
-                         "entity_type": entity.type,
-                         "add_duration_str": SemanticHeaderQueryLibrary.get_add_duration_query_str(add_duration)
-                     })
+                         "add_duration_str": SemanticHeaderQueryLibrary.get_add_duration_query_str(add_duration),
+                         "min_id_subquery": min_id_subquery,
+                         "order_key": order_key,
+                         "return_variables": "n, first, second" if store_entity_id else "first, second",
+                         "set_entity_id": "SET df.entityId = n.sysId" if store_entity_id else ""
+                     },
+                     parameters={"entity_type": entity.type})
 
     @staticmethod
     def get_merge_duplicate_df_entity_query(node: ConstructedNodes) -> Query:
-
-        # language=sql
-        query_str = '''
-                        MATCH (n1:Event)-[rel:$df_entity {entityType: '$entity_type'}]->(n2:Event)
-                        WITH n1, n2, collect(rel) AS rels
-                        WHERE size(rels) > 1
-                        // only include this and the next line if you want to remove the existing relationships
-                        UNWIND rels AS rel 
-                        DELETE rel
-                        MERGE (n1)
-                            -[:$df_entity {entityType: '$entity_type', count:size(rels), type: 'DF'}]->
-                              (n2)
-                    '''
-        return Query(query_str=query_str,
+        return Query(query_str=_MERGE_DUPLICATE_DF_ENTITY_TPL,
                      template_string_parameters={
-                         "entity_type": node.type,
                          "df_entity": node.get_df_label()
-                     })
+                     },
+                     parameters={"entity_type": node.type})
@@ -17,7 +17,7 @@ from ..utilities.auxiliary_functions import replace_undefined_value, create_list
 from ..utilities.configuration import Configuration
 
 
-@dataclass
+@dataclass(frozen=True)
 class DatetimeObject:
     format: str
     timezone_offset: str
@@ -507,15 +507,17 @@ class DataStructure:
         df_log.to_pickle(preprocessed_file_path)
 
     def _get_preprocessed_file_name(self, file_name, use_sample):
-        # change extension from csv to pkl and add sample in case of sample
+        # change extension to pkl and add sample in case of sample
         sample_is_used = use_sample and len(self.samples) > 0
-        preprocessed_file_name = f"{file_name[:-4]}_sample.pkl" if sample_is_used else f"{file_name[:-4]}.pkl"
+        file_name_wo_extension = os.path.splitext(file_name)[0]
+        preprocessed_file_name = f"{file_name_wo_extension}_sample.pkl" if sample_is_used \
+            else f"{file_name_wo_extension}.pkl"
         return preprocessed_file_name
 
     @staticmethod
     def create_record_id_column(df_log, file_name):
         record_id_column = df_log.index
-        record_id_column = record_id_column.astype(str) + "_" + file_name[:-4]
+        record_id_column = record_id_column.astype(str) + "_" + os.path.splitext(file_name)[0]
         return record_id_column
 
     def prepare_event_data_sets(self, file_name, use_sample):
@@ -530,8 +532,16 @@ class DataStructure:
                                             usecols=required_columns, dtype=dtypes, true_values=true_values,
                                             false_values=false_values, sep=self.seperator, decimal=self.decimal,
                                             encoding=self.encoding)
+        elif file_name.endswith('.parquet'):
+            # columnar files are read without tokenizing text, only the required columns are read
+            # reading parquet files requires pyarrow, which is installed with the parquet extra (promg[parquet])
+            df_log: DataFrame = pd.read_parquet(os.path.join(self.file_directory, file_name),
+                                                columns=required_columns)
+            # cast to the defined dtypes, missing values remain missing (as when reading a csv file)
+            for column, dtype in dtypes.items():
+                df_log[column] = df_log[column].astype(dtype).where(df_log[column].notna())
         else:
-            raise TypeError(f"The file extension of {file_name} is not implemented. Use .csv.")
+            raise TypeError(f"The file extension of {file_name} is not implemented. Use .csv or .parquet.")
 
         if use_sample and self.has_datetime_attribute():
             df_log = self.create_sample(file_name, df_log)
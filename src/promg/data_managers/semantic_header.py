@@ -403,13 +403,8 @@ class InferredRelationship:
         return InferredRelationship(event=_event, record_types=_record_labels, relation_type=_relation_type)
 
     def get_record_type_match(self, record_name="record"):
-        all_matches = ""
-        for record_type in self.record_types:
-            match_str = '''MATCH ($record_name:Record) - [:IS_OF_TYPE] -> (:RecordType {type:"$record_type"}) \n'''
-            match = Template(match_str).substitute(record_name=record_name,
-                                                   record_type=record_type)
-            all_matches += match
-        return all_matches
+        return "".join(f'''MATCH ({record_name}:Record) - [:IS_OF_TYPE] -> (:RecordType {{type:"{record_type}"}}) \n'''
+                       for record_type in self.record_types)
 
 
 class NodeConstructor:
@@ -818,6 +813,11 @@ class RecordConstructor:
         self.record_labels = record_labels
         self.required_attributes = required_attributes
         self.optional_attributes = optional_attributes
+        # patterns only depend on the record description, which does not change after parsing, hence they are stored
+        # per record name once they are created
+        self._record_patterns: Dict[str, str] = {}
+        self._required_attributes_patterns: Dict[str, str] = {}
+        self._record_labels_pattern = ":".join(self.record_labels)
 
     @staticmethod
     def from_dict(obj: Any) -> "RecordConstructor":
@@ -863,7 +863,9 @@ class RecordConstructor:
                                  required_attributes=_required_attributes, optional_attributes=_optional_attributes)
 
     def get_prevalent_record_pattern(self, record_name: str = "record"):
-        return self.prevalent_record.get_pattern(record_name)
+        if record_name not in self._record_patterns:
+            self._record_patterns[record_name] = self.prevalent_record.get_pattern(record_name)
+        return self._record_patterns[record_name]
 
     def get_prevalent_match_record_pattern(self, record_name: str = "record"):
         return self.prevalent_record.get_record_type_match(name=record_name)
@@ -875,11 +877,13 @@ class RecordConstructor:
         return ""
 
     def get_required_attributes_is_not_null_pattern(self, record_name: str = "record"):
-        return " AND ".join(
-            [f'''{record_name}.{attribute} IS NOT NULL''' for attribute in self.required_attributes])
+        if record_name not in self._required_attributes_patterns:
+            self._required_attributes_patterns[record_name] = " AND ".join(
+                [f'''{record_name}.{attribute} IS NOT NULL''' for attribute in self.required_attributes])
+        return self._required_attributes_patterns[record_name]
 
     def get_record_labels_pattern(self):
-        return ":".join(self.record_labels)
+        return self._record_labels_pattern
 
     def get_label_list(self, as_str=True):
         if as_str:
@@ -1,21 +1,71 @@
+from dataclasses import dataclass
 from string import Template
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Union
 
 import neo4j
 from ..utilities.configuration import Configuration
 
 
 class Query:
-    def __init__(self, query_str: str, database: str = None, parameters: Optional[Dict[str, any]] = None,
+    __slots__ = ("query_string", "kwargs", "database")
+
+    def __init__(self, query_str: Union[str, Template], database: str = None,
+                 parameters: Optional[Dict[str, any]] = None,
                  template_string_parameters: Optional[Dict[str, any]] = None):
-        if template_string_parameters is not None:
-            self.query_string = Template(query_str).safe_substitute(template_string_parameters)
+        # query strings that are used often can be passed as precompiled Template
+        template = query_str if isinstance(query_str, Template) else None
+        if template is not None and template_string_parameters is None:
+            self.query_string = template.template
+        elif template_string_parameters is not None:
+            if template is None:
+                template = Template(query_str)
+            self.query_string = template.safe_substitute(template_string_parameters)
         else:
             self.query_string = query_str
         self.kwargs = parameters
         self.database = database
 
 
+@dataclass(frozen=True)
+class PeriodicConfig:
+    """
+    Configuration of the batches in which apoc.periodic.iterate executes a query
+
+    @param batch_size: the number of rows per batch, if None the batch size of the connection is used
+    @param parallel: whether batches are executed in parallel
+    @param concurrency: the number of batches executed concurrently, if None the default of apoc is used
+    @param retries: the number of times a failed batch is retried
+    @param batch_mode: how the rows are passed to the action statement, BATCH, BATCH_SINGLE or SINGLE
+    """
+    batch_size: Optional[int] = None
+    parallel: bool = False
+    concurrency: Optional[int] = None
+    retries: int = 0
+    batch_mode: str = "BATCH"
+
+    def __post_init__(self):
+        # apoc.periodic.iterate does not process any batch when the batch size or concurrency is 0, so fail fast
+        if self.batch_size is not None and self.batch_size < 1:
+            raise ValueError(f"The batch size should be at least 1, now it is {self.batch_size}")
+        if self.concurrency is not None and self.concurrency < 1:
+            raise ValueError(f"The concurrency should be at least 1, now it is {self.concurrency}")
+
+    def get_config_str(self, params: Optional[str] = None) -> str:
+        config = ["batchSize:$batch_size",
+                  f"parallel:{str(self.parallel).lower()}",
+                  f"retries:{self.retries}",
+                  f'batchMode:"{self.batch_mode}"']
+        if self.concurrency is not None:
+            config.append(f"concurrency:{self.concurrency}")
+        if params is not None:
+            config.append(f"params:{{{params}}}")
+        return "{" + ", ".join(config) + "}"
+
+    def get_parameters(self) -> Dict[str, Any]:
+        # batch_size is only passed when set, such that the batch size of the connection is used otherwise
+        return {"batch_size": self.batch_size} if self.batch_size is not None else {}
+
+
 class Driver(object):
     def __init__(self, uri, auth):
         self._driver = neo4j.GraphDatabase.driver(uri=uri, auth=auth, max_connection_lifetime=200)
@@ -27,6 +77,10 @@ class Driver(object):
 class DatabaseConnection:
     def __init__(self, uri: str, db_name: str, user: str, password: str, verbose: bool = False,
                  batch_size: int = 100000):
+        if batch_size < 1:
+            raise ValueError(f"The batch size should be at least 1, now it is {batch_size}")
+        # the batch size is used by all queries that are executed in batches, unless a query defines its own batch
+        # size. Larger batches mean fewer commits, but each transaction requires proportionally more heap memory.
         self.db_name = db_name
         self.verbose = verbose
         self.batch_size = batch_size
@@ -38,10 +92,9 @@ class DatabaseConnection:
         if result is None:
             return
         query = result.query_string
-        kwargs = result.kwargs
+        # copy the parameters, Query objects can be cached and reused, so they should not be altered
+        kwargs = dict(result.kwargs) if result.kwargs is not None else {}
         database = result.database
-        if kwargs is None:
-            kwargs = {}  # replace None value by an emtpy dictionary
         if ("$batch_size" in query
                 and "batch_size" not in kwargs):  # ensure to not override batch_size if already defined
             kwargs["batch_size"] = self.batch_size
@@ -108,5 +161,5 @@ class DatabaseConnection:
 
     @staticmethod
     def set_up_connection(config: Configuration):
-        return DatabaseConnection(db_name=config.user, uri=config.uri, user=config.user,
+        return DatabaseConnection(db_name=config.db_name, uri=config.uri, user=config.user,
                                   password=config.password, verbose=config.verbose, batch_size=config.batch_size)
@@ -1,15 +1,21 @@
 import os
-from string import Template
-from typing import Optional
+from typing import Optional, List, Dict, Any
 
 from ..data_managers.semantic_header import SemanticHeader
-from ..database_managers.db_connection import DatabaseConnection
+from ..database_managers.db_connection import DatabaseConnection, PeriodicConfig
 from ..data_managers.datastructures import DatasetDescriptions
 from ..utilities.performance_handling import Performance
-from ..cypher_queries.data_importer_ql import DataImporterQueryLibrary as di_ql
+from ..cypher_queries.data_importer_ql import DataImporterQueryLibrary as di_ql, create_mapping_str
 from pathlib import Path
 import pandas as pd
 
+# the types of the dtype mapping used when loading a csv file, and how apoc parses the values of these types
+_CSV_TYPE_PARSERS = {
+    "INTEGER": int,
+    "FLOAT": float,
+    "BOOLEAN": bool
+}
+
 
 def pop_log_name(log):
     # get log name if it is in the log
@@ -39,6 +45,16 @@ class Importer:
         self.records = semantic_header.records
 
         self.load_batch_size = 20000
+        # logs up to this number of rows are sent as parameters in batches of load_batch_size rows, larger logs are
+        # stored in the import directory and loaded using apoc.load.csv
+        self.unwind_rows_limit = 1000000
+        # configuration of the batches in which timestamps are converted and records are filtered, if None the
+        # timestamps are converted in parallel
+        self.convert_timestamps_config: Optional[PeriodicConfig] = None
+        self.filter_records_config = PeriodicConfig()
+        # only logs larger than unwind_rows_limit are loaded from csv, their batches are committed one after another,
+        # the batch size is bounded such that a single transaction does not claim too much heap
+        self.load_csv_config = PeriodicConfig(batch_size=50000, retries=1)
         self.use_sample = use_sample
         self.use_preprocessed_files = use_preprocessed_files
         self.store_files = store_files
@@ -77,22 +93,14 @@ class Importer:
 
     @Performance.track("structure")
     def _reformat_timestamps(self, structure, required_labels):
+        # all timestamp attributes are converted in a single pass over the records
         datetime_formats = structure.get_datetime_formats()
-        for attribute, datetime_format in datetime_formats.items():
-            if datetime_format.is_epoch:
-                self.connection.exec_query(di_ql.get_convert_epoch_to_timestamp_query,
-                                           **{
-                                               "required_labels": required_labels,
-                                               "attribute": attribute,
-                                               "datetime_object": datetime_format
-                                           })
-
-            self.connection.exec_query(di_ql.get_make_timestamp_date_query,
-                                       **{
-                                           "required_labels": required_labels,
-                                           "attribute": attribute,
-                                           "datetime_object": datetime_format
-                                       })
+        self.connection.exec_query(di_ql.get_convert_timestamps_query,
+                                   **{
+                                       "required_labels": required_labels,
+                                       "datetime_conversions": list(datetime_formats.items()),
+                                       "periodic_config": self.convert_timestamps_config
+                                   })
 
     @Performance.track("structure")
     def _filter_nodes(self, structure, required_labels):
@@ -104,7 +112,8 @@ class Importer:
                                                "prop": name,
                                                "values": values,
                                                "exclude": exclude,
-                                               "required_labels": required_labels
+                                               "required_labels": required_labels,
+                                               "periodic_config": self.filter_records_config
                                            })
 
     @Performance.track("file_name")
@@ -121,33 +130,78 @@ class Importer:
             self.import_log_into_db(file_name=new_file_name, labels=labels, mapping_str=mapping_str, log=log)
 
     def import_log_into_db(self, file_name, labels, mapping_str, log):
-        # Temporary save the file in the import directory
         log, log_name = pop_log_name(log)
 
-        self._save_log_grouped_by_labels(log=log, file_name=file_name)
         # first create the record types and log nodes
         self.connection.exec_query(di_ql.get_create_record_types_and_log_query,
                                    **{
                                        "labels": labels,
                                        "log_name": log_name
                                    })
+
         # when creating the records nodes, relations between the record types and log nodes are created
+        if len(log) <= self.unwind_rows_limit:
+            self._import_log_by_unwinding_rows(labels=labels, log_name=log_name, mapping_str=mapping_str, log=log)
+        else:
+            self._import_log_by_loading_csv(file_name=file_name, labels=labels, log_name=log_name,
+                                            mapping_str=mapping_str, log=log)
+
+    def _import_log_by_unwinding_rows(self, labels, log_name, mapping_str, log):
+        rows = self._determine_rows(log=log, mapping_str=mapping_str)
+        for start in range(0, len(rows), self.load_batch_size):
+            self.connection.exec_query(di_ql.get_create_nodes_by_unwinding_rows_query,
+                                       **{
+                                           "labels": labels,
+                                           "rows": rows[start:start + self.load_batch_size],
+                                           "log_name": log_name
+                                       })
+
+    def _import_log_by_loading_csv(self, file_name, labels, log_name, mapping_str, log):
+        # Temporary save the file in the import directory
+        self._save_log_grouped_by_labels(log=log, file_name=file_name)
+
         self.connection.exec_query(di_ql.get_create_nodes_by_loading_csv_query,
                                    **{
                                        "file_name": file_name,
                                        "log_name": log_name,
                                        "labels": labels,
-                                       "mapping": mapping_str
+                                       "mapping": mapping_str,
+                                       "periodic_config": self.load_csv_config
                                    })
 
         # delete the file from the import directory
         self._delete_log_grouped_by_labels(file_name=file_name)
 
+    @staticmethod
+    def _determine_rows(log, mapping_str) -> List[Dict[str, Any]]:
+        # the rows get the same properties as when the log is stored as csv file (_save_log_grouped_by_labels) and
+        # loaded using the dtype mapping (get_create_nodes_by_loading_csv_query):
+        # - missing values are written as empty values
+        # - empty values are only left out when the csv is loaded with nullValues, i.e. when there is a mapping string
+        # - columns with a dtype mapping are parsed to that type, all other columns are loaded as string
+        log = log.drop(columns=["labels"])
+        mapping = Importer._determine_column_mapping(log)
+        use_null_values = create_mapping_str(mapping_str) != ""
+
+        rows = []
+        for row in log.to_dict(orient="records"):
+            properties = {}
+            for key, value in row.items():
+                if pd.isna(value) or value == "":
+                    if not use_null_values:
+                        properties[key] = ""
+                    continue
+                properties[key] = _CSV_TYPE_PARSERS[mapping[key]](value) if key in mapping else str(value)
+            rows.append(properties)
+        return rows
+
     @staticmethod
     def determine_new_file_name(file_name, optional_labels_str):
+        # the log is always stored as csv file in the import directory, independent of the format of the source file
+        file_name_wo_extension = os.path.splitext(file_name)[0]
         if optional_labels_str == "":
-            return file_name
-        return file_name[:-4] + "_" + optional_labels_str.replace(":", "_") + ".csv"
+            return file_name_wo_extension + ".csv"
+        return file_name_wo_extension + "_" + optional_labels_str.replace(":", "_") + ".csv"
 
     def _save_log_grouped_by_labels(self, log, file_name):
         log = log.drop(columns=["labels"])
@@ -159,7 +213,7 @@ class Importer:
             os.remove(path)
 
     @staticmethod
-    def _determine_column_mapping_str(log):
+    def _determine_column_mapping(log) -> Dict[str, str]:
         mapping = {}
         dtypes = log.dtypes.to_dict()
         for col_name, type in dtypes.items():
@@ -173,11 +227,12 @@ class Importer:
                 mapping[col_name] = 'BOOLEAN'
             else:
                 raise Exception(f"Type for column {col_name} is not defined")
+        return mapping
 
-        template_str = '$col_name:{type:"$type"}'
-        mapping_list = [Template(template_str).substitute({"col_name": col_name, "type": type}) for col_name, type in
-                        mapping.items()]
-        mapping_str = '{' + ','.join(mapping_list) + '}'
+    @staticmethod
+    def _determine_column_mapping_str(log):
+        mapping = Importer._determine_column_mapping(log)
+        mapping_str = '{' + ','.join(f'{col_name}:{{type:"{type}"}}' for col_name, type in mapping.items()) + '}'
         return mapping_str
 
     def retrieve_import_directory(self):
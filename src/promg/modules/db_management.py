@@ -36,11 +36,15 @@ class DBManagement:
         """
         Set constraints in Neo4j instance
         """
+        # each constraint and index is set in its own transaction, such that a failing one does not roll back the others
+        self._drop_entity_named_log_constraint()
         self._set_sysid_constraints(entity_key_name=entity_key_name)
         self.connection.exec_query(dbm_ql.get_set_unique_log_name_index_query)
         self.connection.exec_query(dbm_ql.get_set_activity_index_query)
+        self.connection.exec_query(dbm_ql.get_set_entity_type_name_index_query)
+        self.connection.exec_query(dbm_ql.get_set_event_timestamp_index_query)
         self.connection.exec_query(dbm_ql.get_set_record_id_as_range_query)
-        self.connection.exec_query(dbm_ql.get_set_record_type_range_query)
+        self._set_record_type_constraint()
 
     def get_constraints(self, ignore_defaults=True):
         results = self.connection.exec_query(dbm_ql.get_constraints_query)
@@ -50,6 +54,20 @@ class DBManagement:
             constraint_names.remove("index_f7700477")  # default token lookup index for relationship types
         return constraint_names
 
+    def _drop_entity_named_log_constraint(self) -> None:
+        # databases created by earlier versions have a constraint on the log names named unique_entity_ids
+        result = self.connection.exec_query(dbm_ql.get_entity_named_log_constraint_query)
+        if result is None:
+            return
+        for record in result:
+            self.connection.exec_query(dbm_ql.get_drop_constraint_query, **{"constraint_name": record["name"]})
+
+    def _set_record_type_constraint(self) -> None:
+        # the uniqueness constraint on the record types replaces their range index, the range index is dropped first
+        # as both cannot exist on the same property
+        self.connection.exec_query(dbm_ql.get_drop_record_type_range_query)
+        self.connection.exec_query(dbm_ql.get_constraint_unique_record_type_query)
+
     def _set_sysid_constraints(self, entity_key_name="sysId"):
         if self.semantic_header is not None:
             for node in self.semantic_header.nodes:
@@ -99,9 +117,8 @@ class DBManagement:
         # in case there are no labels, return an empty set
         if result is None:
             return set([])
-        # some nodes have multiple labels, which are returned as a list of labels
-        # therefore we need to flatten the result and take the set
-        result = set([record for sublist in result for record in sublist["label"]])
+        # store the results in a set
+        result = set([record["label"] for record in result])
         return result
 
     def get_statistics(self) -> List[Dict[str, any]]:
@@ -112,19 +129,15 @@ class DBManagement:
             A list containing dictionaries with the label/relationship and its count
         """
 
-        def make_empty_list_if_none(_list: Optional[List[Dict[str, str]]]):
-            if _list is not None:
-                return _list
-            else:
-                return []
-
-        node_count = self.connection.exec_query(dbm_ql.get_node_count_query)
-        edge_count = self.connection.exec_query(dbm_ql.get_edge_count_query)
-        agg_edge_count = self.connection.exec_query(dbm_ql.get_aggregated_edge_count_query)
+        # all counts are retrieved in a single query
+        result = self.connection.exec_query(dbm_ql.get_statistics_query)
+        if result is None:
+            return []
+        counts = result[0]
         result = \
-            make_empty_list_if_none(node_count) + \
-            make_empty_list_if_none(edge_count) + \
-            make_empty_list_if_none(agg_edge_count)
+            [{"label": label, "numberOfNodes": count} for label, count in counts["nodeCounts"]] + \
+            [{"aggType": agg_type, "aggNumberOfRelations": count} for agg_type, count in counts["edgeCounts"]] + \
+            [{"type": type, "numberOfRelations": count} for type, count in counts["aggregatedEdgeCounts"]]
         return result
 
     def print_statistics(self) -> None:
@@ -1,3 +1,5 @@
+from typing import Optional, List
+
 from .. import SemanticHeader
 from ..database_managers.db_connection import DatabaseConnection
 from ..utilities.performance_handling import Performance
@@ -8,12 +10,13 @@ class ProcessDiscovery:
     def __init__(self, db_connection):
         self.connection = db_connection
 
-    def create_df_process_model(self, entity_type: str):
+    def create_df_process_model(self, entity_type: str, activity_names: Optional[List[str]] = None):
         """
         Create a DF process model
 
         Args:
             entity_type: The type of the entity
+            activity_names: The activities to include in the model, if None all activities are included
 
         Raises:
             ValueError: when the entity has not been defined
@@ -21,9 +24,10 @@ class ProcessDiscovery:
         entity = SemanticHeader().get_entity(entity_type)
         if entity_type is None:
             raise ValueError(f"{entity_type} is not defined in semantic header")
-        self._create_df_process_model(entity=entity)
+        self._create_df_process_model(entity=entity, activity_names=activity_names)
 
     @Performance.track("entity")
-    def _create_df_process_model(self, entity):
+    def _create_df_process_model(self, entity, activity_names=None):
         self.connection.exec_query(analysis_ql.get_aggregate_df_relations_query,
-                                   **{"entity": entity})
+                                   **{"entity": entity,
+                                      "activity_names": activity_names})
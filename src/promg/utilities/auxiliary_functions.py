@@ -1,4 +1,6 @@
+import copy
 import re
+from functools import lru_cache, wraps
 from typing import Any, Optional, Dict, List
 
 
@@ -27,3 +29,62 @@ def get_id_attribute_from_label(label):
     else: # no lower case has been found
         first_lower_case = len(label)
     return label[:first_lower_case].lower() + label[first_lower_case:] + "Id"
+
+
+# labels, property keys and constraint names that are substituted in the query text are restricted to plain names, as
+# schema commands and patterns do not accept them as parameters
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def validate_name(name: str) -> None:
+    if _NAME_RE.match(name) is None:
+        raise ValueError(f"{name} is not a valid name, only letters, digits and underscores are allowed")
+
+
+class _FrozenList(tuple):
+    """
+    Hashable stand-in of a list argument of a cached query builder, it is converted back to a list before the builder
+    is called
+    """
+
+
+def _make_hashable(value):
+    if isinstance(value, list):
+        return _FrozenList(_make_hashable(item) for item in value)
+    return value
+
+
+def _restore_value(value):
+    if isinstance(value, _FrozenList):
+        return [_restore_value(item) for item in value]
+    return value
+
+
+def cache_query(func):
+    """
+    Memoize a query builder, such that building the same query twice does not construct the query string again.
+    Only builders whose arguments are values (strings, numbers, booleans, frozen dataclasses and lists or tuples of
+    these) can be cached, other arguments raise a TypeError. Every call returns its own copy of the Query, so the
+    parameters of a cached Query are never shared between callers.
+    """
+
+    @lru_cache(maxsize=256, typed=True)
+    def cached_func(*args, **kwargs):
+        args = tuple(_restore_value(arg) for arg in args)
+        kwargs = {key: _restore_value(value) for key, value in kwargs.items()}
+        return func(*args, **kwargs)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        args = tuple(_make_hashable(arg) for arg in args)
+        kwargs = {key: _make_hashable(value) for key, value in kwargs.items()}
+        query = cached_func(*args, **kwargs)
+        if query is None:
+            return None
+        query = copy.copy(query)
+        query.kwargs = copy.deepcopy(query.kwargs)
+        return query
+
+    wrapper.cache_info = cached_func.cache_info
+    wrapper.cache_clear = cached_func.cache_clear
+    return wrapper
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the package uses a src layout, make it importable when the tests are run from a checkout
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("neo4j")
+
+from promg.database_managers.db_connection import Query
+from promg.utilities.auxiliary_functions import cache_query
+
+
+@cache_query
+def build_query(labels, log_name=None):
+    return Query(query_str="MATCH (n:$labels) RETURN n",
+                 parameters={"labels": labels, "log_name": log_name, "is_list": isinstance(labels, list)})
+
+
+def test_list_arguments_are_passed_as_list():
+    query = build_query(["Record", "Event"])
+
+    assert query.kwargs["is_list"]
+    assert query.kwargs["labels"] == ["Record", "Event"]
+
+
+def test_cached_queries_do_not_share_parameters():
+    first = build_query(["Record"], log_name="log")
+    first.kwargs["labels"].append("Event")
+    second = build_query(["Record"], log_name="log")
+
+    assert second is not first
+    assert second.kwargs["labels"] == ["Record"]
+    assert build_query.cache_info().hits > 0
+
+
+def test_unhashable_arguments_are_not_cached():
+    with pytest.raises(TypeError):
+        build_query({"label": "Record"})
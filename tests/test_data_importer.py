@@ -0,0 +1,59 @@
+import csv
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("neo4j")
+
+from promg.cypher_queries.data_importer_ql import create_mapping_str
+from promg.modules.data_importer import Importer
+
+
+def load_csv_rows(log, mapping_str, path):
+    """
+    Load the log the way the csv path does: store it with _save_log_grouped_by_labels and read it back with the
+    semantics of apoc.load.csv, i.e. nullValues when there is a mapping string and the values of mapped columns parsed
+    to their type
+    """
+    log.drop(columns=["labels"]).to_csv(path, index=False)
+    mapping = Importer._determine_column_mapping(log.drop(columns=["labels"]))
+    use_null_values = create_mapping_str(mapping_str) != ""
+    parsers = {"INTEGER": int, "FLOAT": float, "BOOLEAN": lambda value: value.lower() == "true"}
+
+    rows = []
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            properties = {}
+            for key, value in row.items():
+                if value == "" and use_null_values:
+                    continue
+                properties[key] = parsers[mapping[key]](value) if key in mapping and value != "" else value
+            rows.append(properties)
+    return rows
+
+
+@pytest.mark.parametrize("log", [
+    pd.DataFrame({
+        "activity": ["a", "", None],
+        "count": [1, 2, 3],
+        "amount": [3.0, float("nan"), 1.5],
+        "done": [True, False, True],
+        "mixed": [1, "b", None],
+        "labels": ["", "", ""]
+    }),
+    # a log with only string columns
+    pd.DataFrame({
+        "activity": ["a", "", None],
+        "resource": ["r", "s", ""],
+        "labels": ["", "", ""]
+    })
+])
+def test_unwinding_rows_equals_loading_csv(log, tmp_path):
+    mapping_str = Importer._determine_column_mapping_str(log)
+
+    unwound_rows = Importer._determine_rows(log=log, mapping_str=mapping_str)
+    loaded_rows = load_csv_rows(log=log, mapping_str=mapping_str, path=tmp_path / "log.csv")
+
+    assert unwound_rows == loaded_rows
+    for unwound_row, loaded_row in zip(unwound_rows, loaded_rows):
+        assert [type(value) for value in unwound_row.values()] == [type(value) for value in loaded_row.values()]
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("neo4j")
+
+from promg.cypher_queries.data_importer_ql import DataImporterQueryLibrary as di_ql
+from promg.data_managers.datastructures import DatetimeObject
+
+
+def test_convert_float_timestamp_without_decimals():
+    # a timestamp with format yyyyMMdd that is loaded as FLOAT, e.g. 20230101.0, should be formatted as "20230101"
+    datetime_object = DatetimeObject(format="yyyyMMdd", timezone_offset="", convert_to="ISO_DATE", is_epoch=False,
+                                     unit="")
+    query = di_ql.get_convert_timestamps_query(required_labels=["Record"],
+                                               datetime_conversions=[("timestamp", datetime_object)])
+
+    assert "toFloatOrNull(record.timestamp) = record.timestamp" in query.query_string
+    assert "toInteger(record.timestamp) = record.timestamp" in query.query_string
+    assert "THEN toString(toInteger(record.timestamp))" in query.query_string
+    assert "ELSE toString(record.timestamp)" in query.query_string